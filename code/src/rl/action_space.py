@@ -46,6 +46,9 @@ class ActionSpace:
         
         # 动作验证缓存
         self._action_cache = {}
+
+        # 随机动作采样用的生成器（由环境reset(seed=...)设置，None时使用全局RNG）
+        self.generator: Optional[torch.Generator] = None
         
     def _setup_adjacency_info(self):
         """设置用于动作验证的邻接信息"""
@@ -232,13 +235,15 @@ class ActionSpace:
         
     def sample_random_action(self,
                            current_partition: torch.Tensor,
-                           boundary_nodes: torch.Tensor) -> Optional[Tuple[int, int]]:
+                           boundary_nodes: torch.Tensor,
+                           generator: Optional[torch.Generator] = None) -> Optional[Tuple[int, int]]:
         """
         采样一个随机有效动作
         
         Args:
             current_partition: 当前分区分配
             boundary_nodes: 当前边界节点
+            generator: 可选的随机数生成器，缺省时使用self.generator
             
         Returns:
             随机有效动作或None（如果没有有效动作）
@@ -249,7 +254,9 @@ class ActionSpace:
             return None
             
         # 采样随机动作
-        action_idx = torch.randint(0, len(valid_actions), (1,)).item()
+        generator = generator if generator is not None else self.generator
+        device = generator.device if generator is not None else None
+        action_idx = torch.randint(0, len(valid_actions), (1,), generator=generator, device=device).item()
         return valid_actions[action_idx]
         
     def get_action_space_size(self) -> int:
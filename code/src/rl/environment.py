@@ -3,6 +3,8 @@ import numpy as np
 from typing import Dict, Tuple, List, Optional, Union, Any
 from torch_geometric.data import HeteroData
 import copy
+import re
+from collections import deque
 from .scenario_context import ScenarioContext
 
 try:
@@ -21,6 +23,20 @@ except ImportError:
         print("警告：无法导入RL模块的某些组件")
 
 
+def _edge_type_key(edge_type: tuple) -> str:
+    """边类型三元组对应的标准注意力权重键: src__rel__dst"""
+    return f"{edge_type[0]}__{edge_type[1]}__{edge_type[2]}"
+
+
+def _edge_type_fuzzy_pattern(edge_type: tuple) -> "re.Pattern":
+    """
+    边类型的模糊匹配正则：键中同时包含源类型、关系和目标类型（顺序不限），
+    或者是编码器输出的 "unknown_edge_type" 占位键
+    """
+    src, rel, dst = (re.escape(str(part)) for part in edge_type)
+    return re.compile(rf"^(?=.*{src})(?=.*{rel})(?=.*{dst})|unknown_edge_type", re.DOTALL)
+
+
 class PowerGridPartitioningEnv:
     """
     电力网络分割MDP环境
@@ -54,13 +70,25 @@ class PowerGridPartitioningEnv:
         self.max_steps = max_steps
         self.config = config
 
+        # 边类型的标准字符串键 "src__rel__dst"（构造时生成一次）
+        self._edge_type_key_str: Dict[tuple, str] = {
+            edge_type: _edge_type_key(edge_type) for edge_type in self.hetero_data.edge_index_dict.keys()
+        }
+        # 注意力权重键的模糊匹配正则（每种边类型预编译一次）
+        self._attn_fuzzy_re: Dict[tuple, "re.Pattern"] = {
+            edge_type: _edge_type_fuzzy_pattern(edge_type) for edge_type in self.hetero_data.edge_index_dict.keys()
+        }
+        # 边类型到注意力权重键的解析缓存（每种边类型只做一次字符串匹配）
+        self._attn_key_cache: Dict[tuple, Optional[str]] = {}
+
         # 生成增强的节点嵌入（如果提供了注意力权重）
         enhanced_embeddings = self._generate_enhanced_embeddings(
             node_embeddings, attention_weights
         ) if attention_weights else node_embeddings
 
         # 初始化核心组件
-        self.state_manager = StateManager(hetero_data, enhanced_embeddings, device, config)
+        self.state_manager = StateManager(hetero_data, enhanced_embeddings, device, config,
+                                          num_partitions=num_partitions)
         self.action_space = ActionSpace(hetero_data, num_partitions, device)
 
         # 【新增】确保ActionMask处理器被初始化
@@ -71,11 +99,17 @@ class PowerGridPartitioningEnv:
         reward_config = {
             'reward_weights': reward_weights,
             'thresholds': reward_weights.get('thresholds', {}) if reward_weights else {},
-            'max_steps': max_steps
+            'max_steps': max_steps,
+            'num_partitions': num_partitions
         }
         # 如果config中有adaptive_quality配置，添加到reward_config中
         if config and 'adaptive_quality' in config:
             reward_config['adaptive_quality'] = config['adaptive_quality']
+        # 可选：用torch.compile融合每步调用的奖励指标核函数
+        if config and 'torch_compile' in config:
+            reward_config['torch_compile'] = config['torch_compile']
+        if config and 'cuda_graph' in config:
+            reward_config['cuda_graph'] = config['cuda_graph']
 
         self.reward_function = RewardFunction(
             hetero_data,
@@ -102,12 +136,30 @@ class PowerGridPartitioningEnv:
         if config and config.get('adaptive_curriculum', {}).get('enabled', False):
             self.dynamic_constraint_params['constraint_mode'] = 'soft'
 
-        # 环境状态
+        # 观察所有权：默认False，会随step变化的张量以独立副本返回，调用方可以跨步保存；
+        # True时返回状态管理器内部张量的引用（后续step会原地更新），由调用方负责clone
+        self.return_observation_view = config.get('return_observation_view', False) if config else False
+
+        # 环境状态（回合历史最多保留max_steps步，避免长时间训练中无界增长）
         self.current_step = 0
-        self.episode_history = []
+        self.episode_history = deque(maxlen=self.max_steps)
         self.is_terminated = False
         self.is_truncated = False
 
+        # 收敛检查用的定长奖励环形缓冲区及其运行和/平方和，使标准差计算为O(1)；
+        # 基于奖励收敛的自然终止会改变训练动态，默认关闭（config['convergence_termination']）
+        self.convergence_termination = config.get('convergence_termination', False) if config else False
+        self._convergence_window = 10
+        self._reward_ring = deque(maxlen=self._convergence_window)
+        self._rs = 0.0
+        self._rss = 0.0
+
+        # 每个环境独立的随机数生成器（由reset(seed=...)设置），避免修改进程全局RNG状态
+        self._torch_gen: Optional[torch.Generator] = None
+
+        # 各分区节点数缓存 [num_partitions + 1]，每步只移动一个节点，增量维护
+        self._partition_counts = None
+
         # 缓存频繁使用的数据
         self._setup_cached_data()
 
@@ -141,25 +193,32 @@ class PowerGridPartitioningEnv:
     def _extract_edge_info(self) -> Dict[str, torch.Tensor]:
         """提取奖励计算所需的边信息"""
         edge_info = {}
-        
-        # 收集所有边及其属性
-        all_edges = []
-        all_edge_attrs = []
-        
-        for edge_type, edge_index in self.hetero_data.edge_index_dict.items():
-            edge_attr = self.hetero_data.edge_attr_dict[edge_type]
-            
-            # 将本地索引转换为全局索引
+        edge_index_dict = self.hetero_data.edge_index_dict
+        edge_attr_dict = self.hetero_data.edge_attr_dict
+
+        # 第一遍：统计总边数，一次性分配连续缓冲区
+        total_edges = sum(edge_index.shape[1] for edge_index in edge_index_dict.values())
+        edge_index_buf = torch.empty((2, total_edges), dtype=torch.long, device=self.device)
+        if edge_attr_dict:
+            first_attr = next(iter(edge_attr_dict.values()))
+            edge_attr_buf = torch.empty((total_edges, *first_attr.shape[1:]),
+                                        dtype=first_attr.dtype, device=self.device)
+        else:
+            edge_attr_buf = torch.empty(0, device=self.device)
+
+        # 第二遍：将本地索引转换为全局索引并按偏移写入缓冲区
+        offset = 0
+        for edge_type, edge_index in edge_index_dict.items():
+            num_edges = edge_index.shape[1]
             src_type, _, dst_type = edge_type
-            src_global = self.state_manager.local_to_global(edge_index[0], src_type)
-            dst_global = self.state_manager.local_to_global(edge_index[1], dst_type)
-            
-            global_edges = torch.stack([src_global, dst_global], dim=0)
-            all_edges.append(global_edges)
-            all_edge_attrs.append(edge_attr)
-        
-        edge_info['edge_index'] = torch.cat(all_edges, dim=1)
-        edge_info['edge_attr'] = torch.cat(all_edge_attrs, dim=0)
+
+            edge_index_buf[0, offset:offset + num_edges] = self.state_manager.local_to_global(edge_index[0], src_type)
+            edge_index_buf[1, offset:offset + num_edges] = self.state_manager.local_to_global(edge_index[1], dst_type)
+            edge_attr_buf[offset:offset + num_edges] = edge_attr_dict[edge_type]
+            offset += num_edges
+
+        edge_info['edge_index'] = edge_index_buf
+        edge_info['edge_attr'] = edge_attr_buf
         
         return edge_info
 
@@ -189,32 +248,19 @@ class PowerGridPartitioningEnv:
             if node_type in node_attention_scores and node_attention_scores[node_type] is not None:
                 attention_features = node_attention_scores[node_type]
 
-                # 检查数值稳定性
-                if torch.isnan(embeddings).any() or torch.isinf(embeddings).any():
-                    print(f"  ⚠️ {node_type}: 检测到原始嵌入中的NaN/Inf值")
-                    embeddings = torch.nan_to_num(embeddings, nan=0.0, posinf=1.0, neginf=-1.0)
-
-                if torch.isnan(attention_features).any() or torch.isinf(attention_features).any():
-                    print(f"  ⚠️ {node_type}: 检测到注意力特征中的NaN/Inf值")
-                    attention_features = torch.nan_to_num(attention_features, nan=0.0, posinf=1.0, neginf=-1.0)
-
                 # 连接原始嵌入和注意力特征: H' = concat(H, H_attn)
                 enhanced_emb = torch.cat([embeddings, attention_features], dim=1)
 
-                # 检查连接后的嵌入是否有极值
-                if torch.isnan(enhanced_emb).any() or torch.isinf(enhanced_emb).any():
-                    print(f"  ⚠️ {node_type}: 检测到增强嵌入中的NaN/Inf值，进行清理")
-                    enhanced_emb = torch.nan_to_num(enhanced_emb, nan=0.0, posinf=1.0, neginf=-1.0)
+                # 数值稳定性：cat已生成新张量，直接原地清理一次NaN/Inf，无需先探测
+                torch.nan_to_num_(enhanced_emb, nan=0.0, posinf=1.0, neginf=-1.0)
 
                 enhanced_embeddings[node_type] = enhanced_emb
             else:
                 # 如果没有注意力权重，使用原始嵌入
-                # 仍然检查数值稳定性
-                if torch.isnan(embeddings).any() or torch.isinf(embeddings).any():
-                    print(f"  ⚠️ {node_type}: 检测到原始嵌入中的NaN/Inf值")
-                    embeddings = torch.nan_to_num(embeddings, nan=0.0, posinf=1.0, neginf=-1.0)
-
-                enhanced_embeddings[node_type] = embeddings
+                # 仍然保证数值稳定性（非原地，避免修改调用方传入的嵌入）
+                enhanced_embeddings[node_type] = torch.nan_to_num(
+                    embeddings, nan=0.0, posinf=1.0, neginf=-1.0
+                )
 
         return enhanced_embeddings
 
@@ -232,16 +278,14 @@ class PowerGridPartitioningEnv:
         返回:
             node_attention_scores: 每个节点类型的注意力分数 [num_nodes, 1]
         """
-        # 初始化节点注意力分数累积器
-        node_attention_accumulator = {}
-        node_degree_counter = {}
-        edge_type_to_key_mapping = {}  # 添加这个变量
+        # 只传输实际匹配到的注意力权重，每个张量一次（多个边类型可能共用同一个回退键）。
+        # 非阻塞拷贝仅用于目标为CUDA的情形：设备→主机的非阻塞拷贝可能与随后的CPU读取竞争
+        non_blocking = self.device.type == 'cuda'
+        device_weights: Dict[int, torch.Tensor] = {}
 
-        # 初始化所有节点类型的累积器
-        for node_type in self.hetero_data.x_dict.keys():
-            num_nodes = self.hetero_data.x_dict[node_type].shape[0]
-            node_attention_accumulator[node_type] = torch.zeros(num_nodes, device=self.device)
-            node_degree_counter[node_type] = torch.zeros(num_nodes, device=self.device)
+        # 按目标节点类型收集入边的注意力权重（同一节点可能来自多种边类型）
+        dst_nodes_per_type = {node_type: [] for node_type in self.hetero_data.x_dict.keys()}
+        weights_per_type = {node_type: [] for node_type in self.hetero_data.x_dict.keys()}
 
         # 处理每种边类型
         has_attention = False
@@ -249,13 +293,16 @@ class PowerGridPartitioningEnv:
             src_type, relation, dst_type = edge_type
             
             # 使用改进的键匹配，找不到时返回None
-            attn_weights = self._get_attention_weights_for_edge_type(
-                edge_type, attention_weights, edge_type_to_key_mapping
-            )
+            attn_weights = self._get_attention_weights_for_edge_type(edge_type, attention_weights)
             
             # 如果找不到权重，则跳过此边类型
             if attn_weights is None:
                 continue
+
+            moved = device_weights.get(id(attn_weights))
+            if moved is None:
+                moved = device_weights[id(attn_weights)] = attn_weights.to(self.device, non_blocking=non_blocking)
+            attn_weights = moved
             
             has_attention = True
             # 处理维度和多头注意力（维度不匹配时返回None）
@@ -267,25 +314,23 @@ class PowerGridPartitioningEnv:
             if processed_weights is None:
                 continue
             
-            # 高效的节点聚合
-            dst_nodes = edge_index[1]
-            node_attention_accumulator[dst_type].index_add_(0, dst_nodes, processed_weights)
-            node_degree_counter[dst_type].index_add_(0, dst_nodes, torch.ones_like(processed_weights))
+            dst_nodes_per_type[dst_type].append(edge_index[1])
+            weights_per_type[dst_type].append(processed_weights)
 
         # 如果没有任何注意力权重，直接返回
         if not has_attention:
             return {node_type: None for node_type in self.hetero_data.x_dict.keys()}
 
-        # 计算平均注意力分数（避免除零）
+        # 计算平均注意力分数：单次scatter_reduce求均值，
+        # include_self=False 使没有入边的节点保持为0（避免除零）
         node_attention_scores = {}
-        for node_type in node_attention_accumulator.keys():
-            degrees = node_degree_counter[node_type]
-            # 避免除零：度为0的节点注意力分数设为0
-            avg_attention = torch.where(
-                degrees > 0,
-                node_attention_accumulator[node_type] / degrees,
-                torch.zeros_like(node_attention_accumulator[node_type])
-            )
+        for node_type, x in self.hetero_data.x_dict.items():
+            avg_attention = torch.zeros(x.shape[0], device=self.device)
+
+            if dst_nodes_per_type[node_type]:
+                dst_nodes = torch.cat(dst_nodes_per_type[node_type])
+                weights = torch.cat(weights_per_type[node_type])
+                avg_attention.scatter_reduce_(0, dst_nodes, weights, reduce='mean', include_self=False)
 
             # 转换为列向量 [num_nodes, 1]
             node_attention_scores[node_type] = avg_attention.unsqueeze(1)
@@ -294,49 +339,63 @@ class PowerGridPartitioningEnv:
 
     def _get_attention_weights_for_edge_type(self,
                                             edge_type: tuple,
-                                            attention_weights: Dict[str, torch.Tensor],
-                                            edge_type_to_key_mapping: Dict[str, str]) -> Optional[torch.Tensor]:
+                                            attention_weights: Dict[str, torch.Tensor]) -> Optional[torch.Tensor]:
         """
         获取特定边类型的注意力权重
 
         参数:
             edge_type: 边类型 (src_type, relation, dst_type)
             attention_weights: 边级注意力权重字典
-            edge_type_to_key_mapping: 边类型到注意力权重键的映射
 
         返回:
             找到的注意力权重，如果找不到则返回None
         """
-        # 构建边类型到注意力权重键的映射
-        edge_type_key = f"{edge_type[0]}__{edge_type[1]}__{edge_type[2]}"
-        edge_type_to_key_mapping[edge_type_key] = edge_type_key
-
-        # 尝试多种键格式来查找注意力权重
-        found_weights = None
-        used_key = None
+        # 优先使用缓存的键；缓存键不在当前权重字典中（未解析过或字典的键不同）时重新解析并更新缓存
+        used_key = self._attn_key_cache.get(edge_type)
+        if used_key is None or used_key not in attention_weights:
+            edge_type_key = self._edge_type_key_str.get(edge_type)
+            if edge_type_key is None:
+                edge_type_key = self._edge_type_key_str[edge_type] = _edge_type_key(edge_type)
+            used_key = self._attn_key_cache[edge_type] = self._resolve_attention_key(
+                edge_type, edge_type_key, attention_weights
+            )
 
-        # 1. 尝试标准格式
-        if edge_type_key in attention_weights:
-            found_weights = attention_weights[edge_type_key]
-            used_key = edge_type_key
-        else:
-            # 2. 尝试查找包含相关信息的键
-            for key, weights in attention_weights.items():
-                if (edge_type[0] in key and edge_type[2] in key and edge_type[1] in key) or \
-                   ("unknown_edge_type" in key):
-                    found_weights = weights
-                    used_key = key
-                    break
-
-        if found_weights is None:
+        if used_key is None:
             # print(f"    ⚠️ 未找到边类型 {edge_type_key} 的注意力权重")
             # print(f"       可用的注意力权重键: {list(attention_weights.keys())}")
             return None
 
-        attn_weights = found_weights.to(self.device)
+        # 设备传输由调用方按需完成
+        attn_weights = attention_weights[used_key]
         # print(f"    🔍 边类型 {edge_type} 使用注意力权重键: {used_key}")
         return attn_weights
 
+    def _resolve_attention_key(self,
+                               edge_type: tuple,
+                               edge_type_key: str,
+                               attention_weights: Dict[str, torch.Tensor]) -> Optional[str]:
+        """
+        解析边类型对应的注意力权重键
+
+        参数:
+            edge_type: 边类型 (src_type, relation, dst_type)
+            edge_type_key: 标准格式的键 "src__rel__dst"
+            attention_weights: 边级注意力权重字典
+
+        返回:
+            匹配到的键，如果找不到则返回None
+        """
+        # 1. 尝试标准格式
+        if edge_type_key in attention_weights:
+            return edge_type_key
+
+        # 2. 尝试查找包含相关信息的键（预编译正则，一次扫描完成三段匹配）
+        pattern = self._attn_fuzzy_re.get(edge_type)
+        if pattern is None:
+            pattern = self._attn_fuzzy_re[edge_type] = _edge_type_fuzzy_pattern(edge_type)
+
+        return next((key for key in attention_weights.keys() if pattern.search(key)), None)
+
     def _process_attention_weights(self, 
                                  attn_weights: torch.Tensor,
                                  edge_index: torch.Tensor,
@@ -365,31 +424,46 @@ class PowerGridPartitioningEnv:
         
         return attn_weights
 
-    def reset(self, seed: Optional[int] = None, scenario_context: Optional[ScenarioContext] = None) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+    def reset(self, seed: Optional[int] = None, scenario_context: Optional[ScenarioContext] = None,
+              clone_partition: bool = False) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
         """
         将环境重置为初始状态
         
         参数:
             seed: 用于可重复性的随机种子
             scenario_context: 场景上下文（用于场景感知奖励）
+            clone_partition: 是否在info中返回分区的独立副本；默认返回只读引用，
+                             后续step()会原地修改它，需要保存时请传入True
             
         返回:
             observation: 初始状态观察
             info: 附加信息
         """
         if seed is not None:
-            torch.manual_seed(seed)
-            np.random.seed(seed)
+            self._torch_gen = torch.Generator(device=self.device).manual_seed(seed)
+            # 随机动作采样与初始分区共用同一个环境级生成器
+            self.action_space.generator = self._torch_gen
             
         # 使用METIS初始化分区
-        initial_partition = self.metis_initializer.initialize_partition(self.num_partitions)
+        initial_partition = self.metis_initializer.initialize_partition(
+            self.num_partitions, generator=self._torch_gen
+        )
         
         # 使用初始分区重置状态管理器
         self.state_manager.reset(initial_partition)
+
+        # 初始化分区大小缓存
+        self._partition_counts = torch.bincount(
+            self.state_manager.current_partition,
+            minlength=self.num_partitions + 1
+        )
         
         # 重置环境状态
         self.current_step = 0
-        self.episode_history = []
+        self.episode_history.clear()
+        self._reward_ring.clear()
+        self._rs = 0.0
+        self._rss = 0.0
         self.is_terminated = False
         self.is_truncated = False
 
@@ -397,10 +471,13 @@ class PowerGridPartitioningEnv:
         self.reward_function.reset_episode(scenario_context)
         
         # 获取初始观察
-        observation = self.state_manager.get_observation()
+        observation = self._get_observation()
+        boundary_nodes = self.state_manager.get_boundary_nodes()
 
         # 添加动作掩码到观察中
-        observation['action_mask'] = self.get_action_mask(use_advanced_constraints=True)
+        observation['action_mask'] = self.get_action_mask(
+            use_advanced_constraints=True, boundary_nodes=boundary_nodes
+        )
         
         # 【优化】跳过昂贵的绝对指标计算，只计算质量分数
         initial_quality_score = self.reward_function.get_current_quality_score(
@@ -417,11 +494,11 @@ class PowerGridPartitioningEnv:
         info = {
             'step': self.current_step,
             'metrics': initial_metrics,
-            'partition': self.state_manager.current_partition.clone(),
-            'boundary_nodes': self.state_manager.get_boundary_nodes(),
+            'partition': self._partition_snapshot(clone_partition),
+            'boundary_nodes': boundary_nodes,
             'valid_actions': self.action_space.get_valid_actions(
                 self.state_manager.current_partition,
-                self.state_manager.get_boundary_nodes()
+                boundary_nodes
             ),
             'scenario_context': scenario_context.to_dict() if scenario_context else None
         }
@@ -456,7 +533,7 @@ class PowerGridPartitioningEnv:
             self.state_manager.get_boundary_nodes()
         ):
             # 无效动作惩罚
-            return self.state_manager.get_observation(), -2.0, True, False, {'termination_reason': 'invalid_action'}
+            return self._get_observation(), -2.0, True, False, {'termination_reason': 'invalid_action'}
 
         # 2. 【新增】连通性约束检查（软约束模式）
         constraint_violation_info = self.action_space.mask_handler.check_connectivity_violation(
@@ -469,15 +546,20 @@ class PowerGridPartitioningEnv:
         if constraint_mode == 'hard' and constraint_violation_info and constraint_violation_info['violates_connectivity']:
             # 硬约束模式：拒绝执行违规动作
             # 【修复】将连通性违规惩罚从-10.0降低到-3.0，仍然严厉但不会压倒其他奖励
-            return self.state_manager.get_observation(), -3.0, True, False, {
+            return self._get_observation(), -3.0, True, False, {
                 'termination_reason': 'connectivity_violation',
                 'violation_info': constraint_violation_info
             }
 
         # 4. 执行动作，更新内部状态
         node_idx, target_partition = action
+        old_partition = self.state_manager.current_partition[node_idx].item()
         self.state_manager.update_partition(node_idx, target_partition)
 
+        # O(1)增量更新分区大小缓存
+        self._partition_counts[old_partition] -= 1
+        self._partition_counts[target_partition] += 1
+
         # 5. 【核心】计算奖励 - 使用自适应质量导向奖励系统
         plateau_result = None
         # 获取当前场景上下文
@@ -490,9 +572,11 @@ class PowerGridPartitioningEnv:
         )
 
         # 6. 【优化】跳过昂贵的绝对指标计算，只计算质量分数用于奖励
-        # 这些绝对指标（cv、coupling_ratio等）在不同场景下没有可比性，且计算昂贵
+        # 这些绝对指标（cv、coupling_ratio等）在不同场景下没有可比性，且计算昂贵；
+        # compute_incremental_reward 已基于当前分区算出核心指标，这里直接复用
+        core_metrics = self.reward_function.current_metrics
         quality_score = self.reward_function.get_current_quality_score(
-            self.state_manager.current_partition
+            self.state_manager.current_partition, core_metrics
         )
 
         # 创建轻量级指标字典，只包含训练必需的信息
@@ -538,9 +622,13 @@ class PowerGridPartitioningEnv:
                 early_stop_triggered = True
                 early_stop_confidence = plateau_result.confidence
 
-        # 7. 更新步数和检查终止条件
+        # 7. 记录本步奖励（仅在启用收敛终止时），更新步数和检查终止条件
+        if self.convergence_termination:
+            self._record_step_reward(float(reward))
+        # 动作执行后边界节点只获取一次，供终止检查和动作掩码共用
+        boundary_nodes = self.state_manager.get_boundary_nodes()
         self.current_step += 1
-        terminated, truncated = self._check_termination()
+        terminated, truncated = self._check_termination(boundary_nodes)
 
         # 8. 【新增】应用早停逻辑
         if early_stop_triggered and not terminated and not truncated:
@@ -564,7 +652,8 @@ class PowerGridPartitioningEnv:
             # 使用奖励函数计算终局奖励
             final_reward, final_components = self.reward_function.compute_final_reward(
                 self.state_manager.current_partition,
-                termination_type
+                termination_type,
+                current_metrics=core_metrics
             )
             reward += final_reward
 
@@ -584,10 +673,12 @@ class PowerGridPartitioningEnv:
         success = self._evaluate_step_success(reward, current_metrics, quality_score, connectivity_score)
         
         # 9. 准备返回信息
-        observation = self.state_manager.get_observation()
+        observation = self._get_observation()
 
         # 添加动作掩码到观察中
-        observation['action_mask'] = self.get_action_mask(use_advanced_constraints=True)
+        observation['action_mask'] = self.get_action_mask(
+            use_advanced_constraints=True, boundary_nodes=boundary_nodes
+        )
         
         info = {
             'step': self.current_step,
@@ -606,6 +697,21 @@ class PowerGridPartitioningEnv:
     
 
 
+    def _get_observation(self) -> Dict[str, torch.Tensor]:
+        """
+        获取当前观察
+
+        return_observation_view为True时，返回的张量与状态管理器共享存储，
+        下一次step()会覆盖其内容；需要跨步保存观察的调用方必须自行clone。
+        否则只复制会被原地更新的current_partition：观察缓冲区复用只在视图模式下启用，
+        此时region_embeddings/boundary_features是新分配的；静态的node_embeddings和
+        按需重建的boundary_nodes直接返回。
+        """
+        observation = self.state_manager.get_observation()
+        if not self.return_observation_view:
+            observation['current_partition'] = observation['current_partition'].clone()
+        return observation
+
     def _determine_termination_type(self, terminated: bool, truncated: bool) -> str:
         """
         确定终止类型，用于双层奖励函数
@@ -627,10 +733,13 @@ class PowerGridPartitioningEnv:
         else:
             return 'unknown'
         
-    def _check_termination(self) -> Tuple[bool, bool]:
+    def _check_termination(self, boundary_nodes: Optional[torch.Tensor] = None) -> Tuple[bool, bool]:
         """
         检查回合是否应该终止或截断 - 支持软约束模式
 
+        参数:
+            boundary_nodes: 当前边界节点，调用方已获取时传入以避免重复查询
+
         返回:
             terminated: 自然终止（收敛或无有效动作）
             truncated: 人工终止（达到最大步数）
@@ -640,7 +749,8 @@ class PowerGridPartitioningEnv:
             return False, True
 
         # 检查自然终止
-        boundary_nodes = self.state_manager.get_boundary_nodes()
+        if boundary_nodes is None:
+            boundary_nodes = self.state_manager.get_boundary_nodes()
 
         # 【关键修复】使用当前的约束模式来获取有效动作
         constraint_mode = self.dynamic_constraint_params.get('constraint_mode', 'hard')
@@ -660,24 +770,46 @@ class PowerGridPartitioningEnv:
 
         return False, False
         
-    def _check_convergence(self, window_size: int = 10, threshold: float = 0.01) -> bool:
+    def _record_step_reward(self, reward: float, step_record: Optional[Dict[str, Any]] = None):
+        """
+        记录一步奖励，供收敛检查使用
+
+        参数:
+            reward: 该步奖励
+            step_record: 可选的完整步骤记录，仅用于日志，提供时追加到episode_history
+        """
+        if len(self._reward_ring) == self._reward_ring.maxlen:
+            evicted = self._reward_ring[0]
+            self._rs -= evicted
+            self._rss -= evicted * evicted
+
+        self._reward_ring.append(reward)
+        self._rs += reward
+        self._rss += reward * reward
+
+        if step_record is not None:
+            self.episode_history.append(step_record)
+
+    def _check_convergence(self, threshold: float = 0.01) -> bool:
         """
         基于最近奖励历史检查分区是否收敛
         
         参数:
-            window_size: 要考虑的最近步数
-            threshold: 收敛阈值
+            threshold: 收敛阈值（最近窗口内奖励的标准差）
             
         返回:
             如果收敛返回True，否则返回False
         """
-        if len(self.episode_history) < window_size:
+        window_size = self._reward_ring.maxlen
+        if len(self._reward_ring) < window_size:
             return False
-            
-        recent_rewards = [step['reward'] for step in self.episode_history[-window_size:]]
-        reward_std = np.std(recent_rewards)
-        
-        return reward_std < threshold
+
+        mean = self._rs / window_size
+        # 运行和相减可能引入微小的负舍入误差
+        variance = max(self._rss / window_size - mean * mean, 0.0)
+
+        # 比较方差与阈值平方，省去开方
+        return variance < threshold * threshold
         
     def render(self, mode: str = 'human') -> Optional[np.ndarray]:
         """
@@ -697,10 +829,7 @@ class PowerGridPartitioningEnv:
             output.append(f"总节点数: {self.total_nodes}")
             
             # 分区分布
-            partition_counts = torch.bincount(
-                self.state_manager.current_partition, 
-                minlength=self.num_partitions + 1
-            )[1:]  # 跳过分区0
+            partition_counts = self.get_partition_counts()[1:]  # 跳过分区0
             output.append(f"分区大小: {partition_counts.tolist()}")
             
             # 边界节点
@@ -731,16 +860,21 @@ class PowerGridPartitioningEnv:
         self.metis_initializer = None
         self.evaluator = None
         
-    def get_action_mask(self, use_advanced_constraints: bool = True) -> torch.Tensor:
+    def get_action_mask(self, use_advanced_constraints: bool = True,
+                        boundary_nodes: Optional[torch.Tensor] = None) -> torch.Tensor:
         """
         获取当前状态的动作掩码 - 支持动态约束模式
 
         参数:
             use_advanced_constraints: 是否使用高级约束
+            boundary_nodes: 当前边界节点，调用方已获取时传入以避免重复查询
 
         返回:
             指示有效动作的布尔张量
         """
+        if boundary_nodes is None:
+            boundary_nodes = self.state_manager.get_boundary_nodes()
+
         if use_advanced_constraints:
             # 使用高级掩码，根据当前约束模式决定行为
             constraint_mode = self.dynamic_constraint_params.get('constraint_mode', 'hard')
@@ -748,7 +882,7 @@ class PowerGridPartitioningEnv:
 
             return self.action_space.get_advanced_mask(
                 state,
-                self.state_manager.get_boundary_nodes(),
+                boundary_nodes,
                 self.hetero_data,
                 apply_constraints=True,
                 constraint_mode=constraint_mode
@@ -757,18 +891,41 @@ class PowerGridPartitioningEnv:
             # 使用基础掩码
             return self.action_space.get_action_mask(
                 self.state_manager.current_partition,
-                self.state_manager.get_boundary_nodes()
+                boundary_nodes
             )
         
-    def get_state_info(self) -> Dict[str, Any]:
+    def get_partition_counts(self) -> torch.Tensor:
+        """
+        获取各分区的节点数（含未分配的分区0）
+
+        返回:
+            长度至少为 num_partitions + 1 的计数张量（内部增量缓存的副本，修改它不影响环境）
+        """
+        if self._partition_counts is None:
+            return torch.bincount(
+                self.state_manager.current_partition,
+                minlength=self.num_partitions + 1
+            )
+        return self._partition_counts.clone()
+
+    def _partition_snapshot(self, clone_partition: bool = False) -> torch.Tensor:
+        """返回当前分区：默认为分离的引用（调用方只读），clone_partition=True时返回独立副本"""
+        partition = self.state_manager.current_partition.detach()
+        return partition.clone() if clone_partition else partition
+
+    def get_state_info(self, clone_partition: bool = False) -> Dict[str, Any]:
         """
         获取当前状态的详细信息
         
+        参数:
+            clone_partition: 是否返回分区的独立副本；默认返回只读引用，
+                             后续step()会原地修改它
+        
         返回:
             包含状态信息的字典
         """
         return {
-            'current_partition': self.state_manager.current_partition.clone(),
+            'current_partition': self._partition_snapshot(clone_partition),
             'boundary_nodes': self.state_manager.get_boundary_nodes(),
             'step': self.current_step,
             'max_steps': self.max_steps,
@@ -789,22 +946,25 @@ class PowerGridPartitioningEnv:
             连通性分数 [0, 1]，1表示完全连通
         """
         try:
-            # 获取分区数量
-            num_partitions = partition.max().item()
-            if num_partitions <= 0:
-                return 0.0
+            # 简化的连通性检查：检查每个分区是否至少有一个节点。
+            # 当前分区直接读取 step() 增量维护的计数缓存，其他分区做一次bincount
+            if self._partition_counts is not None and partition is self.state_manager.current_partition:
+                partition_counts = self._partition_counts.tolist()
+            else:
+                partition_counts = torch.bincount(partition).tolist()
 
-            # 简化的连通性检查：检查每个分区是否至少有一个节点
-            connected_partitions = 0
-            for i in range(1, num_partitions + 1):
-                if (partition == i).any():
-                    connected_partitions += 1
+            # 分区数量 = 最大分区标签，即最后一个非空分区的编号
+            occupied = [pid for pid in range(1, len(partition_counts)) if partition_counts[pid] > 0]
+            if not occupied:
+                return 0.0
+            num_partitions = occupied[-1]
+            connected_partitions = len(occupied)
 
             # 连通性分数 = 有节点的分区数 / 总分区数
             connectivity_score = connected_partitions / num_partitions
 
             # 额外检查：如果所有节点都被分配，给予额外奖励
-            unassigned_nodes = (partition == 0).sum().item()
+            unassigned_nodes = int(partition_counts[0])
             if unassigned_nodes == 0:
                 connectivity_score = min(1.0, connectivity_score + 0.1)
 
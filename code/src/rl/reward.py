@@ -20,6 +20,7 @@
 日期：2025-01-15
 """
 
+import math
 import torch
 import numpy as np
 import hashlib
@@ -35,6 +36,168 @@ from .scenario_aware_plateau_detector import ScenarioAwarePlateauDetector
 from .relative_reward_calculator import RelativeImprovementReward, HybridRewardFunction
 
 
+def _relative_improvement(prev_quality: float, curr_quality: float) -> float:
+    """
+    相对改进奖励的纯标量核心，裁剪到 [-1.0, 1.0]
+
+    每步调用，只做浮点运算，用内置min/max代替np.clip以避免NumPy标量分派开销
+    """
+    if prev_quality > 0.01:  # 避免除零，处理边界情况
+        relative_improvement = (curr_quality - prev_quality) / prev_quality
+    else:
+        # 从零开始的情况，直接用绝对改进
+        relative_improvement = curr_quality - prev_quality
+
+    return max(-1.0, min(1.0, relative_improvement))
+
+
+def _balance_reward_core(cv: float) -> float:
+    """负载平衡奖励的纯标量核心：R_balance = exp(-2.0 * CV)，CV非有限时按最差情况处理"""
+    if not math.isfinite(cv):
+        cv = 1.0  # 最差情况
+    else:
+        cv = max(0.0, min(cv, 10.0))  # 确保CV在合理范围内
+
+    # CV已限制在[0, 10]，exp不会溢出，结果天然落在(0, 1]
+    return math.exp(-2.0 * cv)
+
+
+def _power_reward_core(power_imbalance_normalized: float) -> float:
+    """功率平衡奖励的纯标量核心：R_power = exp(-3.0 * I_normalized)，输入非有限时按最差情况处理"""
+    if not math.isfinite(power_imbalance_normalized):
+        power_imbalance_normalized = 1.0  # 最差情况
+    else:
+        power_imbalance_normalized = max(0.0, min(power_imbalance_normalized, 10.0))
+
+    # 指数参数限制在[-30, 0]，不会溢出，结果天然落在(0, 1]
+    return math.exp(-3.0 * power_imbalance_normalized)
+
+
+def _partition_balance_kernel(partition: torch.Tensor,
+                              num_active: torch.Tensor,
+                              node_loads: torch.Tensor,
+                              node_generation: torch.Tensor,
+                              num_partitions: int,
+                              epsilon: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    负载平衡CV与归一化功率不平衡的纯张量核心
+
+    用scatter_add一次得到各分区的负载/发电总和，全部分支用torch.where表达，
+    不含.item()和NumPy调用，可以被torch.compile整体融合。
+    bin数由固定的分区容量决定，实际分区数以张量传入，因此每步形状不变、不会触发重新编译。
+
+    Args:
+        partition: 当前分区方案 [num_nodes]
+        num_active: 当前分区数（分区标签的最大值），0维张量
+        node_loads: 节点有功负载 [num_nodes]
+        node_generation: 节点有功发电 [num_nodes]
+        num_partitions: 分区容量K（固定，须不小于num_active）
+        epsilon: 数值稳定性参数
+
+    Returns:
+        (cv, power_imbalance_normalized)，均为0维张量
+    """
+    # 分区标签可能以紧凑整数类型存储，scatter索引需要int64
+    partition = partition.long()
+    num_bins = num_partitions + 1
+    partition_loads = torch.zeros(num_bins, dtype=node_loads.dtype, device=node_loads.device)
+    partition_loads = partition_loads.scatter_add(0, partition, node_loads.abs())[1:]
+    load_sums = torch.zeros(num_bins, dtype=node_loads.dtype, device=node_loads.device)
+    load_sums = load_sums.scatter_add(0, partition, node_loads)[1:]
+    gen_sums = torch.zeros(num_bins, dtype=node_generation.dtype, device=node_generation.device)
+    gen_sums = gen_sums.scatter_add(0, partition, node_generation)[1:]
+
+    # 1. 负载平衡指标 (CV)：只统计标签 1..num_active 的分区（含空分区），
+    #    无偏标准差；均值/标准差异常或均值非正时取最差值1.0
+    active = torch.arange(1, num_bins, device=partition.device) <= num_active
+    count = active.sum().to(node_loads.dtype)
+    zeros = torch.zeros_like(partition_loads)
+    mean_load = torch.where(active, partition_loads, zeros).sum() / count
+    squared_dev = torch.where(active, (partition_loads - mean_load) ** 2, zeros)
+    std_load = torch.sqrt(squared_dev.sum() / (count - 1))
+    cv_valid = torch.isfinite(mean_load) & (mean_load > 0) & torch.isfinite(std_load)
+    cv = torch.where(
+        cv_valid,
+        torch.clamp(std_load / (mean_load + epsilon), 0.0, 10.0),
+        torch.ones_like(mean_load)
+    )
+
+    # 2. 功率平衡指标：跳过结果非有限的分区（空分区的不平衡为0）
+    imbalance = torch.abs(gen_sums - load_sums)
+    partition_valid = torch.isfinite(gen_sums) & torch.isfinite(load_sums) & torch.isfinite(imbalance)
+    total_imbalance = torch.where(partition_valid, imbalance, torch.zeros_like(imbalance)).sum()
+
+    total_load = node_loads.abs().sum()
+    power_valid = torch.isfinite(total_load) & (total_load > 0)
+    power_imbalance_normalized = torch.where(
+        power_valid,
+        torch.clamp(total_imbalance / (total_load + epsilon), 0.0, 10.0),
+        torch.ones_like(total_load)
+    )
+
+    return cv, power_imbalance_normalized
+
+
+class _CudaGraphKernel:
+    """
+    用CUDA Graph回放固定形状的每步核函数
+
+    节点数和分区容量K在环境构造后固定，因此通常只需捕获一次图；
+    之后每步只把分区和实际分区数写入静态输入缓冲区并回放，一次启动代替数十个核函数。
+    非CUDA设备上直接以eager模式调用原函数。
+    """
+
+    def __init__(self, fn, warmup_iters: int = 3):
+        self.fn = fn
+        self.warmup_iters = warmup_iters
+        self.static_partition = None
+        self.static_num_active = None
+        self.graphs = {}  # num_partitions -> (CUDAGraph, 静态输出)
+
+    def __call__(self,
+                 partition: torch.Tensor,
+                 num_active: torch.Tensor,
+                 node_loads: torch.Tensor,
+                 node_generation: torch.Tensor,
+                 num_partitions: int,
+                 epsilon: float) -> Tuple[torch.Tensor, torch.Tensor]:
+        if not partition.is_cuda:
+            return self.fn(partition, num_active, node_loads, node_generation, num_partitions, epsilon)
+
+        if self.static_partition is None or self.static_partition.shape != partition.shape \
+                or self.static_partition.dtype != partition.dtype \
+                or self.static_num_active.dtype != num_active.dtype:
+            self.static_partition = torch.empty_like(partition)
+            self.static_num_active = torch.empty_like(num_active)
+            self.graphs = {}
+        self.static_partition.copy_(partition)
+        self.static_num_active.copy_(num_active)
+
+        if num_partitions not in self.graphs:
+            self.graphs[num_partitions] = self._capture(node_loads, node_generation, num_partitions, epsilon)
+
+        graph, static_outputs = self.graphs[num_partitions]
+        graph.replay()
+        return static_outputs
+
+    def _capture(self, node_loads, node_generation, num_partitions, epsilon):
+        """在侧流上预热后捕获核函数；node_loads等静态张量按引用被图捕获"""
+        args = (self.static_partition, self.static_num_active, node_loads, node_generation, num_partitions, epsilon)
+
+        side_stream = torch.cuda.Stream()
+        side_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side_stream):
+            for _ in range(self.warmup_iters):
+                self.fn(*args)
+        torch.cuda.current_stream().wait_stream(side_stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_outputs = self.fn(*args)
+
+        return graph, static_outputs
+
+
 class RobustMetricsCalculator:
     """
     鲁棒的指标计算器，提供智能的错误处理和诊断
@@ -593,6 +756,7 @@ class RewardFunction:
         # 前一步质量分数缓存
         self.previous_quality_score = None
         self.previous_metrics = None  # 保持向后兼容
+        self.current_metrics = None  # 最近一次compute_incremental_reward所评估分区的核心指标
 
         # 当前步数（用于效率奖励计算）
         self.current_step = 0
@@ -679,6 +843,58 @@ class RewardFunction:
         # 边信息（用于计算导纳）
         self._extract_edge_info()
 
+        # 功率数据是静态的，只需检查一次数值稳定性
+        self._power_data_finite = bool(
+            torch.isfinite(self.node_generation).all() and torch.isfinite(self.node_loads).all()
+        )
+
+        # 平衡核函数的固定分区容量（分区标签不会超过节点数）；固定bin数让编译/图捕获只发生一次
+        self._kernel_num_partitions = int(self.config.get('num_partitions') or self.node_loads.shape[0])
+
+        # 每步调用的张量核函数，按配置可选地用torch.compile融合
+        self._balance_kernel = self._build_balance_kernel()
+
+    def _build_balance_kernel(self):
+        """
+        构建负载/功率平衡核函数
+
+        - torch_compile: 返回torch.compile编译版本（reduce-overhead模式自带CUDA Graph）
+        - cuda_graph: 在CUDA设备上手动捕获CUDA Graph并回放
+        - 否则使用eager模式
+
+        torch.compile是延迟编译的，后端错误要到首次调用才会出现，由 _run_balance_kernel 负责回退。
+        """
+        if self.config.get('cuda_graph', False) and self.device.type == 'cuda' \
+                and not self.config.get('torch_compile', False):
+            return _CudaGraphKernel(_partition_balance_kernel)
+
+        if not self.config.get('torch_compile', False) or not hasattr(torch, 'compile'):
+            return _partition_balance_kernel
+
+        try:
+            # reduce-overhead 在CUDA上使用CUDA Graph消除启动开销；节点数与分区容量固定、实际分区数以张量传入，无需动态形状
+            return torch.compile(_partition_balance_kernel, mode='reduce-overhead', dynamic=False)
+        except Exception as e:
+            warnings.warn(f"torch.compile不可用：{e}。使用eager模式。")
+            return _partition_balance_kernel
+
+    def _run_balance_kernel(self, partition: torch.Tensor, max_label: torch.Tensor,
+                            num_partitions: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        调用平衡核函数；编译版或CUDA Graph版执行失败时告警并永久回退到eager模式
+        """
+        capacity = max(self._kernel_num_partitions, num_partitions)
+        args = (partition, max_label, self.node_loads, self.node_generation, capacity, self.epsilon)
+        if self._balance_kernel is _partition_balance_kernel:
+            return _partition_balance_kernel(*args)
+
+        try:
+            return self._balance_kernel(*args)
+        except Exception as e:
+            warnings.warn(f"加速的平衡核函数执行失败：{e}。回退到eager模式。")
+            self._balance_kernel = _partition_balance_kernel
+            return _partition_balance_kernel(*args)
+
     def _safe_extract_power_data(self):
         """安全提取功率数据，避免创建虚假默认数据"""
         if 'bus' not in self.hetero_data.x_dict:
@@ -1133,7 +1349,8 @@ class RewardFunction:
 
         return True
 
-    def _compute_quality_score(self, partition: torch.Tensor) -> float:
+    def _compute_quality_score(self, partition: torch.Tensor,
+                               metrics: Optional[Dict[str, float]] = None) -> float:
         """
         计算统一质量分数
 
@@ -1142,13 +1359,15 @@ class RewardFunction:
 
         Args:
             partition: 当前分区方案 [num_nodes]
+            metrics: 已针对该分区计算好的核心指标（可选，提供时不再重复计算）
 
         Returns:
             质量分数 [0, 1]，越大越好
         """
         try:
             # 计算核心指标
-            metrics = self._compute_core_metrics(partition)
+            if metrics is None:
+                metrics = self._compute_core_metrics(partition)
 
             cv = metrics.get('cv', 1.0)
             coupling_ratio = metrics.get('coupling_ratio', 1.0)
@@ -1207,14 +1426,8 @@ class RewardFunction:
             相对改进奖励 [-1.0, 1.0]
         """
         try:
-            if prev_quality > 0.01:  # 避免除零，处理边界情况
-                relative_improvement = (curr_quality - prev_quality) / prev_quality
-            else:
-                # 从零开始的情况，直接用绝对改进
-                relative_improvement = curr_quality - prev_quality
-
             # 轻微裁剪避免极端值，保持训练稳定性
-            return np.clip(relative_improvement, -1.0, 1.0)
+            return _relative_improvement(float(prev_quality), float(curr_quality))
 
         except Exception as e:
             print(f"警告：相对奖励计算出现异常: {e}")
@@ -1239,7 +1452,8 @@ class RewardFunction:
         metrics = {}
         
         # 获取分区数量
-        num_partitions = partition.max().item()
+        max_label = partition.max()
+        num_partitions = max_label.item()
         if num_partitions <= 0:
             # 如果没有分区，返回最差指标
             return {
@@ -1249,27 +1463,11 @@ class RewardFunction:
                 'num_partitions': 0
             }
             
-        # 1. 计算负载平衡指标 (CV)
-        partition_loads = torch.zeros(num_partitions, device=self.device)
-        for i in range(1, num_partitions + 1):
-            mask = (partition == i)
-            if mask.any():
-                partition_loads[i-1] = self.node_loads[mask].abs().sum()
-                
-        # 计算变异系数，添加数值稳定性保护
-        mean_load = partition_loads.mean()
-        std_load = partition_loads.std()
-        
-        # 多重保护：防止除零、NaN和inf
-        if torch.isnan(mean_load) or torch.isinf(mean_load) or mean_load <= 0:
-            cv = 1.0  # 最差情况
-        elif torch.isnan(std_load) or torch.isinf(std_load):
-            cv = 1.0
-        else:
-            cv = std_load / (mean_load + self.epsilon)
-            cv = torch.clamp(cv, 0.0, 10.0)  # 限制CV在合理范围内
-            
-        metrics['cv'] = cv.item() if torch.is_tensor(cv) else cv
+        # 1. 计算负载平衡指标 (CV) 和功率平衡指标 - 单次张量核函数，一次同步取回
+        cv, power_imbalance_normalized = self._run_balance_kernel(partition, max_label, num_partitions)
+        cv, power_imbalance_normalized = torch.stack([cv, power_imbalance_normalized]).tolist()
+
+        metrics['cv'] = cv
         
         # 2. 计算电气解耦指标 - 使用鲁棒计算器
         if self.edge_index.shape[1] > 0:
@@ -1298,37 +1496,10 @@ class RewardFunction:
             metrics['edge_decoupling_ratio'] = 1.0
             
         # 3. 计算功率平衡指标
-        total_imbalance = 0.0
-        
-        # 检查节点数据的数值稳定性
-        if (torch.isnan(self.node_generation).any() or torch.isinf(self.node_generation).any() or
-            torch.isnan(self.node_loads).any() or torch.isinf(self.node_loads).any()):
+        if not self._power_data_finite:
             # 如果数据有问题，返回最差情况
             metrics['power_imbalance_normalized'] = 1.0
         else:
-            for i in range(1, num_partitions + 1):
-                mask = (partition == i)
-                if mask.any():
-                    partition_generation = self.node_generation[mask].sum()
-                    partition_load = self.node_loads[mask].sum()
-                    
-                    # 检查每个分区的计算结果
-                    if (torch.isnan(partition_generation) or torch.isinf(partition_generation) or
-                        torch.isnan(partition_load) or torch.isinf(partition_load)):
-                        continue  # 跳过有问题的分区
-                        
-                    imbalance = torch.abs(partition_generation - partition_load)
-                    if not (torch.isnan(imbalance) or torch.isinf(imbalance)):
-                        total_imbalance += imbalance.item()
-                    
-            # 归一化功率不平衡，添加多重保护
-            total_load = self.node_loads.abs().sum().item()
-            if total_load <= 0 or np.isnan(total_load) or np.isinf(total_load):
-                power_imbalance_normalized = 1.0  # 最差情况
-            else:
-                power_imbalance_normalized = total_imbalance / (total_load + self.epsilon)
-                power_imbalance_normalized = np.clip(power_imbalance_normalized, 0.0, 10.0)
-                
             metrics['power_imbalance_normalized'] = power_imbalance_normalized
         
         # 4. 其他辅助指标
@@ -1360,13 +1531,15 @@ class RewardFunction:
         if scenario_context is not None:
             self.current_scenario_context = scenario_context
 
-        # 计算当前质量分数
-        current_quality_score = self._compute_quality_score(current_partition)
+        # 计算当前核心指标和质量分数（同一分区的指标只计算一次）
+        current_metrics = self._compute_core_metrics(current_partition)
+        current_quality_score = self._compute_quality_score(current_partition, current_metrics)
 
         # 如果没有前一步质量分数，初始化并返回0
         if self.previous_quality_score is None:
             self.previous_quality_score = current_quality_score
-            self.previous_metrics = self._compute_core_metrics(current_partition)  # 保持向后兼容
+            self.previous_metrics = current_metrics  # 保持向后兼容
+            self.current_metrics = current_metrics
 
             # 更新平台期检测器
             if self.scenario_aware_enabled and scenario_context is not None:
@@ -1383,10 +1556,10 @@ class RewardFunction:
             )
 
             # 数值稳定性保护
-            if np.isnan(main_reward) or np.isinf(main_reward):
+            if not math.isfinite(main_reward):
                 main_reward = 0.0
             else:
-                main_reward = np.clip(main_reward, -2.0, 2.0)  # 扩大范围以支持相对奖励
+                main_reward = max(-2.0, min(2.0, main_reward))  # 扩大范围以支持相对奖励
 
             # 2. 平台期检测和效率奖励
             efficiency_reward = 0.0
@@ -1409,10 +1582,10 @@ class RewardFunction:
             total_reward = main_reward + efficiency_reward
 
             # 最终数值稳定性保护
-            if np.isnan(total_reward) or np.isinf(total_reward):
+            if not math.isfinite(total_reward):
                 total_reward = 0.0
             else:
-                total_reward = np.clip(total_reward, -2.0, 2.0)
+                total_reward = max(-2.0, min(2.0, total_reward))
 
         except Exception as e:
             print(f"警告：自适应质量导向奖励计算出现异常: {e}")
@@ -1421,7 +1594,8 @@ class RewardFunction:
 
         # 更新前一步状态
         self.previous_quality_score = current_quality_score
-        self.previous_metrics = self._compute_core_metrics(current_partition)  # 保持向后兼容
+        self.previous_metrics = current_metrics  # 保持向后兼容
+        self.current_metrics = current_metrics
 
         return total_reward, plateau_result
 
@@ -1430,13 +1604,15 @@ class RewardFunction:
         self.current_step = 0
         self.previous_quality_score = None
         self.previous_metrics = None
+        self.current_metrics = None
         self.current_scenario_context = scenario_context
 
         self.plateau_detector.reset()
 
-    def get_current_quality_score(self, partition: torch.Tensor) -> float:
-        """获取当前质量分数（用于外部调用）"""
-        return self._compute_quality_score(partition)
+    def get_current_quality_score(self, partition: torch.Tensor,
+                                  metrics: Optional[Dict[str, float]] = None) -> float:
+        """获取当前质量分数（用于外部调用），可传入该分区已计算的核心指标以避免重复计算"""
+        return self._compute_quality_score(partition, metrics)
 
     def get_plateau_statistics(self) -> Dict[str, Any]:
         """获取平台期检测统计信息"""
@@ -1466,7 +1642,8 @@ class RewardFunction:
 
     def compute_final_reward(self,
                            final_partition: torch.Tensor,
-                           termination_type: str = 'natural') -> Tuple[float, Dict[str, float]]:
+                           termination_type: str = 'natural',
+                           current_metrics: Optional[Dict[str, float]] = None) -> Tuple[float, Dict[str, float]]:
         """
         计算终局奖励（Reward）
 
@@ -1478,12 +1655,13 @@ class RewardFunction:
         Args:
             final_partition: 最终分区方案
             termination_type: 终止类型 ('natural', 'timeout', 'stuck')
+            current_metrics: 已针对final_partition计算好的核心指标（可选，缺省时重新计算）
 
         Returns:
             (总终局奖励, 奖励组件详情)
         """
         # 计算最终指标
-        final_metrics = self._compute_core_metrics(final_partition)
+        final_metrics = current_metrics if current_metrics is not None else self._compute_core_metrics(final_partition)
 
         # 1. 计算三个核心奖励组件
         balance_reward = self._compute_balance_reward(final_metrics['cv'])
@@ -1528,23 +1706,10 @@ class RewardFunction:
         公式：R_balance = exp(-2.0 * CV)
         CV越小，奖励越接近1.0
         """
-        # 添加数值稳定性保护
-        if np.isnan(cv) or np.isinf(cv):
-            cv = 1.0  # 最差情况
-        else:
-            cv = max(0.0, min(cv, 10.0))  # 确保CV在合理范围内
-
         try:
-            balance_reward = np.exp(-2.0 * cv)
-            # 检查结果
-            if np.isnan(balance_reward) or np.isinf(balance_reward):
-                balance_reward = 0.0
-            else:
-                balance_reward = np.clip(balance_reward, 0.0, 1.0)
+            return _balance_reward_core(float(cv))
         except Exception:
-            balance_reward = 0.0
-
-        return balance_reward
+            return 0.0
 
     def _compute_decoupling_reward(self, edge_decoupling_ratio: float, coupling_ratio: float) -> float:
         """
@@ -1666,29 +1831,10 @@ class RewardFunction:
         公式：R_power = exp(-3.0 * I_normalized)
         I_normalized越小，奖励越接近1.0
         """
-        # 添加数值稳定性保护
-        if np.isnan(power_imbalance_normalized) or np.isinf(power_imbalance_normalized):
-            power_imbalance_normalized = 1.0  # 最差情况
-        else:
-            power_imbalance_normalized = max(0.0, min(power_imbalance_normalized, 10.0))
-
         try:
-            # 限制指数参数避免溢出
-            exp_arg = -3.0 * power_imbalance_normalized
-            exp_arg = np.clip(exp_arg, -500, 0)  # 防止exp溢出
-
-            power_reward = np.exp(exp_arg)
-
-            # 检查结果
-            if np.isnan(power_reward) or np.isinf(power_reward):
-                power_reward = 0.0
-            else:
-                power_reward = np.clip(power_reward, 0.0, 1.0)
-
+            return _power_reward_core(float(power_imbalance_normalized))
         except Exception:
-            power_reward = 0.0
-
-        return power_reward
+            return 0.0
 
 
 
@@ -12,11 +12,21 @@ import torch
 import torch.nn as nn
 import numpy as np
 import time
+import warnings
 from collections import defaultdict
 from typing import Dict, List, Tuple, Optional, Set, Any
 from torch_geometric.data import HeteroData
 
 
+# config['partition_dtype'] 可选的分区标签存储类型
+PARTITION_DTYPES = {
+    'int8': torch.int8,
+    'int16': torch.int16,
+    'int32': torch.int32,
+    'int64': torch.int64,
+}
+
+
 class IntelligentRegionEmbedding:
     """
     智能区域嵌入生成器，优雅处理空分区
@@ -198,7 +208,8 @@ class StateManager:
                  hetero_data: HeteroData,
                  node_embeddings: Dict[str, torch.Tensor],
                  device: torch.device,
-                 config: Dict[str, Any] = None):
+                 config: Dict[str, Any] = None,
+                 num_partitions: Optional[int] = None):
         """
         初始化状态管理器
 
@@ -209,6 +220,7 @@ class StateManager:
                            - 具体取决于Environment是否提供了注意力权重
             device: 计算设备
             config: 配置字典，用于控制输出详细程度
+            num_partitions: 目标分区数量，用于选择分区标签的紧凑存储类型
         """
         self.device = device
         self.hetero_data = hetero_data.to(device)
@@ -223,6 +235,9 @@ class StateManager:
         self._setup_node_embeddings(node_embeddings)
         self._setup_adjacency_info()
 
+        # 分区标签取值在 [0, K]，用紧凑整数类型存储以减少bincount/比较等操作的带宽
+        self.partition_dtype = self._select_partition_dtype(num_partitions)
+
         # 创建智能区域嵌入生成器
         self.region_embedder = IntelligentRegionEmbedding(
             self.embedding_dim,
@@ -235,12 +250,83 @@ class StateManager:
             }) if config else {}
         )
 
+        # 预分配的可复用观察缓冲区（CPU环境可选页锁定内存，供策略端非阻塞H2D拷贝）
+        self._setup_observation_buffers(num_partitions)
+
         # 状态变量
         self.current_partition = None
-        self.boundary_nodes = None
+        # 边界节点以集合维护，张量形式按需生成并缓存，仅在分区变化后失效
+        self._boundary_set: Set[int] = set()
+        self._boundary_cache: Optional[torch.Tensor] = None
+        self._boundary_dirty = True
         self.region_embeddings = None
         self.current_step = 0
         
+    def _select_partition_dtype(self, num_partitions: Optional[int]) -> torch.dtype:
+        """
+        选择分区标签的存储类型
+
+        优先使用 config['partition_dtype'] 覆盖；否则 K < 128 时用int8，K < 32768 时用int16，
+        未知分区数时保持int64
+        """
+        override = self.config.get('partition_dtype') if self.config else None
+        if override is not None:
+            if override not in PARTITION_DTYPES:
+                raise ValueError(f"不支持的partition_dtype: {override}，可选: {list(PARTITION_DTYPES.keys())}")
+            return PARTITION_DTYPES[override]
+
+        if num_partitions is None:
+            return torch.long
+        if num_partitions < 128:
+            return torch.int8
+        if num_partitions < 32768:
+            return torch.int16
+        return torch.long
+
+    def _setup_observation_buffers(self, num_partitions: Optional[int]):
+        """
+        可选：按最大观察尺寸预分配缓冲区，get_observation写入其中并返回视图
+
+        仅在 config['reuse_observation_buffers'] 和 config['return_observation_view'] 均为True时启用。
+        此时返回的区域嵌入和边界特征会被下一次调用覆盖，调用方（如经验回放）跨步保存观察前必须clone；
+        默认关闭，每次返回调用方独占的新张量。视图模式关闭时环境会复制每个观察，
+        复用缓冲区反而多一次写入，因此忽略该选项并告警。
+
+        启用复用且 config['pin_observation_memory'] 为True、计算设备为CPU且CUDA可用时，
+        缓冲区分配在页锁定内存中，下游可用 .to(gpu, non_blocking=True) 与策略计算重叠拷贝。
+        """
+        config = self.config or {}
+        self.reuse_observation_buffers = bool(config.get('reuse_observation_buffers', False))
+        if self.reuse_observation_buffers and not config.get('return_observation_view', False):
+            warnings.warn("reuse_observation_buffers 需要同时设置 return_observation_view=True，已忽略该选项。")
+            self.reuse_observation_buffers = False
+        device_type = torch.device(self.device).type if self.device is not None else 'cpu'
+        self.pin_observation_memory = bool(
+            self.reuse_observation_buffers
+            and config.get('pin_observation_memory', False)
+            and device_type == 'cpu' and torch.cuda.is_available()
+        )
+
+        self._obs_buffers: Optional[Dict[str, torch.Tensor]] = None
+        if not self.reuse_observation_buffers:
+            return
+
+        # 区域嵌入的键最多为 0..K（边界节点被置为0时会出现分区0）
+        max_regions = num_partitions + 1 if num_partitions is not None else self.total_nodes + 1
+        dtype = self.node_embeddings.dtype
+        pin = self.pin_observation_memory
+
+        self._obs_buffers = {
+            'region_embeddings': torch.empty(max_regions, 2 * self.embedding_dim, dtype=dtype,
+                                             device=self.device, pin_memory=pin),
+            'boundary_features': torch.empty(self.total_nodes, self.embedding_dim, dtype=dtype,
+                                             device=self.device, pin_memory=pin),
+        }
+
+        # 静态节点嵌入只需页锁定一次
+        if pin:
+            self.node_embeddings = self.node_embeddings.pin_memory()
+
     def _setup_node_mappings(self):
         """设置局部和全局节点索引之间的映射"""
         self.node_types = list(self.hetero_data.x_dict.keys())
@@ -326,7 +412,9 @@ class StateManager:
         Args:
             initial_partition: 初始分区分配 [total_nodes]
         """
-        self.current_partition = initial_partition.to(self.device)
+        self.current_partition = initial_partition.to(self.device, dtype=self.partition_dtype)
+        if self.pin_observation_memory:
+            self.current_partition = self.current_partition.pin_memory()
         self._update_derived_state()
         
     def update_partition(self, node_idx: int, new_partition: int):
@@ -365,18 +453,13 @@ class StateManager:
                     boundary_set.add(node_idx)
                     break
                     
-        self.boundary_nodes = torch.tensor(list(boundary_set), dtype=torch.long, device=self.device)
+        self._boundary_set = boundary_set
+        self._boundary_dirty = True
         
     def _update_boundary_nodes_incremental(self, changed_node: int, old_partition: int, new_partition: int):
         """单个节点变化后增量更新边界节点"""
-        # 转换为集合以进行高效操作
-        if self.boundary_nodes is not None:
-            try:
-                boundary_set = set(self.boundary_nodes.cpu().numpy())
-            except RuntimeError:
-                boundary_set = set(self.boundary_nodes.cpu().tolist())
-        else:
-            boundary_set = set()
+        # 直接在维护的集合上增量修改，无需张量与集合之间来回转换
+        boundary_set = self._boundary_set
         
         # 检查变化的节点
         is_boundary = False
@@ -408,7 +491,7 @@ class StateManager:
             else:
                 boundary_set.discard(neighbor_idx)
                 
-        self.boundary_nodes = torch.tensor(list(boundary_set), dtype=torch.long, device=self.device)
+        self._boundary_dirty = True
         
     def _compute_region_embeddings(self):
         """计算所有分区的区域聚合嵌入 - 使用智能嵌入生成器"""
@@ -458,40 +541,67 @@ class StateManager:
         """
         获取RL智能体的当前状态观察
 
+        启用 reuse_observation_buffers 时，区域嵌入和边界节点特征写入预分配的缓冲区并以视图返回，
+        下一次调用会覆盖其内容；需要跨步保存时调用方应自行clone。
+
         Returns:
             包含状态组件的字典
         """
         # 将区域嵌入作为张量
         # 注意：region_embeddings的键是实际的分区ID，不一定是连续的1,2,3...
         # 因为某些分区可能在边界节点设置为0后变为空分区
+        buffers = self._obs_buffers
         if self.region_embeddings:
             partition_ids = sorted(self.region_embeddings.keys())
-            region_embedding_tensor = torch.stack([
-                self.region_embeddings[pid] for pid in partition_ids
-            ], dim=0)
+            region_list = [self.region_embeddings[pid] for pid in partition_ids]
+            region_buffer = buffers['region_embeddings'] if buffers is not None else None
+            if (region_buffer is not None
+                    and len(region_list) <= region_buffer.shape[0]
+                    and region_list[0].shape[0] == region_buffer.shape[1]
+                    and region_list[0].dtype == region_buffer.dtype):
+                region_embedding_tensor = region_buffer[:len(region_list)]
+                with torch.no_grad():
+                    torch.stack(region_list, dim=0, out=region_embedding_tensor)
+            else:
+                # 未启用复用或尺寸超出缓冲区（如启用了高级池化），新分配
+                region_embedding_tensor = torch.stack(region_list, dim=0)
         else:
             # 如果没有区域嵌入，创建空张量
             region_embedding_tensor = torch.empty(0, 2 * self.embedding_dim, device=self.device)
         
         # 边界节点特征
-        if len(self.boundary_nodes) > 0:
-            boundary_features = self.node_embeddings[self.boundary_nodes]
-        else:
+        boundary_nodes = self.get_boundary_nodes()
+        if len(boundary_nodes) == 0:
             boundary_features = torch.empty(0, self.embedding_dim, device=self.device)
+        elif buffers is not None:
+            boundary_features = buffers['boundary_features'][:len(boundary_nodes)]
+            with torch.no_grad():
+                torch.index_select(self.node_embeddings, 0, boundary_nodes, out=boundary_features)
+        else:
+            boundary_features = self.node_embeddings[boundary_nodes]
             
         observation = {
             'node_embeddings': self.node_embeddings,  # [total_nodes, embedding_dim]
             'region_embeddings': region_embedding_tensor,  # [num_partitions, 2*embedding_dim]
             'boundary_features': boundary_features,  # [num_boundary, embedding_dim]
             'current_partition': self.current_partition,  # [total_nodes]
-            'boundary_nodes': self.boundary_nodes,  # [num_boundary]
+            'boundary_nodes': boundary_nodes,  # [num_boundary]
         }
         
         return observation
         
     def get_boundary_nodes(self) -> torch.Tensor:
-        """获取当前边界节点"""
-        return self.boundary_nodes if self.boundary_nodes is not None else torch.empty(0, dtype=torch.long, device=self.device)
+        """获取当前边界节点（分区未变化时直接返回缓存的张量）"""
+        if self._boundary_dirty:
+            self._boundary_cache = torch.tensor(list(self._boundary_set), dtype=torch.long, device=self.device,
+                                                pin_memory=self.pin_observation_memory)
+            self._boundary_dirty = False
+        return self._boundary_cache
+
+    @property
+    def boundary_nodes(self) -> torch.Tensor:
+        """当前边界节点 [num_boundary]"""
+        return self.get_boundary_nodes()
         
     def get_global_node_mapping(self) -> Dict[str, torch.Tensor]:
         """获取从节点类型到全局索引的映射"""
@@ -348,7 +348,8 @@ class MetisInitializer:
             from code.src.utils_common import safe_rich_debug
             safe_rich_debug(f"构建邻接列表: {edge_count} 条边, {non_isolated} 个非孤立节点", "metis")
         
-    def initialize_partition(self, num_partitions: int) -> torch.Tensor:
+    def initialize_partition(self, num_partitions: int,
+                             generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """
         使用多阶段方法初始化分区
 
@@ -358,6 +359,7 @@ class MetisInitializer:
 
         参数:
             num_partitions: 目标分区数
+            generator: 可选的随机数生成器（每个环境独立），用于随机分区回退
 
         返回:
             初始分区标签 [num_nodes]
@@ -369,7 +371,7 @@ class MetisInitializer:
 
             if show_metis_details and not only_show_errors:
                 print("🚀 使用 METIS 进行高质量的初始分区...")
-            partition_labels = self._metis_partition(num_partitions)
+            partition_labels = self._metis_partition(num_partitions, generator)
             if show_metis_details and not only_show_errors:
                 from code.src.utils_common import safe_rich_debug
                 safe_rich_debug("METIS 分区成功", "metis")
@@ -378,7 +380,7 @@ class MetisInitializer:
             safe_rich_warning(f"METIS 初始化失败: {e}，回退到谱聚类...")
             try:
                 # 2. 尝试谱聚类
-                partition_labels = self._spectral_partition(num_partitions)
+                partition_labels = self._spectral_partition(num_partitions, generator)
                 from code.src.utils_common import safe_rich_debug
                 safe_rich_debug("谱聚类分区成功", "metis")
             except Exception as e_spectral:
@@ -391,12 +393,13 @@ class MetisInitializer:
 
         return repaired_labels
             
-    def _metis_partition(self, num_partitions: int) -> torch.Tensor:
+    def _metis_partition(self, num_partitions: int,
+                         generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """使用PyMetis算法分区"""
         # 检查是否有边
         if not any(self.adjacency_list):
             # 没有边 - 使用随机分区
-            return self._random_partition(num_partitions)
+            return self._random_partition(num_partitions, generator)
             
         try:
             # PyMetis 需要邻接列表格式，每个元素是 numpy 数组
@@ -410,9 +413,10 @@ class MetisInitializer:
             
         except Exception as e:
             warnings.warn(f"PyMetis失败：{e}。使用谱聚类回退。")
-            return self._spectral_partition(num_partitions)
+            return self._spectral_partition(num_partitions, generator)
             
-    def _spectral_partition(self, num_partitions: int) -> torch.Tensor:
+    def _spectral_partition(self, num_partitions: int,
+                            generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """使用谱聚类分区"""
         # 构建邻接矩阵
         adj_matrix = np.zeros((self.total_nodes, self.total_nodes))
@@ -423,7 +427,7 @@ class MetisInitializer:
                 
         # 处理边界情况
         if np.sum(adj_matrix) == 0:
-            return self._random_partition(num_partitions)
+            return self._random_partition(num_partitions, generator)
             
         try:
             clustering = SpectralClustering(
@@ -439,14 +443,16 @@ class MetisInitializer:
             
         except Exception as e:
             warnings.warn(f"谱聚类失败：{e}。使用随机分区。")
-            return self._random_partition(num_partitions)
+            return self._random_partition(num_partitions, generator)
             
-    def _random_partition(self, num_partitions: int) -> torch.Tensor:
+    def _random_partition(self, num_partitions: int,
+                          generator: Optional[torch.Generator] = None) -> torch.Tensor:
         """作为最终回退的随机分区"""
         partition = torch.randint(
             1, num_partitions + 1,
             (self.total_nodes,),
-            device=self.device
+            device=self.device,
+            generator=generator
         )
         return partition
 